@@ -1,9 +1,16 @@
 # ABOUTME: Main Flask application for the HTMX blog platform.
 # ABOUTME: Handles routing, database operations, and markdown rendering for a simple blog.
 
+import hashlib
+import os
+import queue
 import sqlite3
+import threading
+from collections import OrderedDict
+from html import escape
+
 import markdown
-from datetime import datetime
+from markdown_it import MarkdownIt
 from flask import (
     Flask,
     render_template,
@@ -11,49 +18,179 @@ from flask import (
     g,
     make_response,
 )
+from jinja2 import FileSystemBytecodeCache
 
 app = Flask(__name__)
 app.secret_key = "htmx-blog-secret-key-1337"
 
+# Persist compiled templates so fresh worker processes skip Jinja compilation.
+# The default directory is private to the current user and ownership-checked.
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
+
 DATABASE = "blog.db"
+DB_POOL_SIZE = 8
+DB_STATEMENT_CACHE_SIZE = 256
+PAGE_SIZE = 20
+# Highest page whose OFFSET still fits in SQLite's signed 64-bit integers
+MAX_PAGE = (2**63 - 1) // PAGE_SIZE
+MARKDOWN_BACKENDS = ("markdown-it", "python-markdown")
+MARKDOWN_BACKEND = os.environ.get("MARKDOWN_BACKEND", "markdown-it")
+if MARKDOWN_BACKEND not in MARKDOWN_BACKENDS:
+    raise ValueError(
+        f"MARKDOWN_BACKEND must be one of {', '.join(MARKDOWN_BACKENDS)}, "
+        f"got {MARKDOWN_BACKEND!r}"
+    )
+MARKDOWN_EXTENSIONS = ("fenced_code", "tables")
+MARKDOWN_CACHE_SIZE = 4096
+
+# Flash message wrappers per category; only the message text varies.
+_FLASH_PRE = {
+    category: (
+        '<div id="flash-messages" hx-swap-oob="innerHTML">'
+        f'<div class="flash flash-{category}">'
+    )
+    for category in ("success", "error")
+}
+_FLASH_POST = "</div></div>"
+_FLASH_PRE_BYTES = {category: pre.encode() for category, pre in _FLASH_PRE.items()}
+_FLASH_POST_BYTES = _FLASH_POST.encode()
+
+# Markdown punctuation stripped from list-view previews.
+_PREVIEW_TABLE = str.maketrans("", "", "#*`>")
+
+# Rendered HTML keyed by a digest of the markdown source, oldest first.
+_md_cache = OrderedDict()
+_md_cache_lock = threading.Lock()
+
+# Only the selected backend is built. markdown-it keeps no state between
+# renders, so one parser serves every thread; python-markdown instances are
+# stateful between conversions, so the shared one is used under its lock.
+if MARKDOWN_BACKEND == "python-markdown":
+    _markdown_it = None
+    _python_markdown = markdown.Markdown(extensions=list(MARKDOWN_EXTENSIONS))
+else:
+    _markdown_it = MarkdownIt("commonmark").enable("table")
+    _python_markdown = None
+_python_markdown_lock = threading.Lock()
+
+# Idle database connections shared across requests and threads.
+_db_pool = queue.LifoQueue()
+
+# Rendered homepage as UTF-8 bytes, keyed by the posts_version counter;
+# holds one entry.
+_index_cache = {}
+
+
+def connect_db():
+    """Open a new database connection in WAL mode."""
+    db = sqlite3.connect(
+        DATABASE,
+        check_same_thread=False,
+        cached_statements=DB_STATEMENT_CACHE_SIZE,
+    )
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.execute("PRAGMA wal_autocheckpoint=1000")
+    db.execute("PRAGMA temp_store=MEMORY")
+    db.execute("PRAGMA mmap_size=268435456")
+    return db
 
 
 def get_db():
-    """Get a database connection for the current request."""
+    """Get a pooled database connection for the current request."""
     if "db" not in g:
-        g.db = sqlite3.connect(DATABASE)
-        g.db.row_factory = sqlite3.Row
+        try:
+            g.db = _db_pool.get_nowait()
+        except queue.Empty:
+            g.db = connect_db()
     return g.db
 
 
 @app.teardown_appcontext
-def close_db(exception):
-    """Close the database connection at the end of each request."""
+def release_db(exception):
+    """Return the request's database connection to the pool."""
     db = g.pop("db", None)
-    if db is not None:
+    if db is None:
+        return
+    if db.in_transaction:
+        db.rollback()
+    if _db_pool.qsize() < DB_POOL_SIZE:
+        _db_pool.put(db)
+    else:
         db.close()
 
 
 def init_db():
     """Create the posts table if it doesn't exist and seed sample data."""
-    db = sqlite3.connect(DATABASE)
-    db.row_factory = sqlite3.Row
+    db = connect_db()
     db.execute(
         """
         CREATE TABLE IF NOT EXISTS posts (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             title TEXT NOT NULL,
             body TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            preview TEXT,
+            body_html TEXT,
+            created_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+            updated_at TIMESTAMP DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
         )
     """
     )
+
+    # Databases created before the derived columns existed need them added
+    columns = {row["name"] for row in db.execute("PRAGMA table_info(posts)")}
+    for column in ("preview", "body_html"):
+        if column not in columns:
+            db.execute(f"ALTER TABLE posts ADD COLUMN {column} TEXT")
+    stale = db.execute(
+        "SELECT id, body FROM posts WHERE preview IS NULL OR body_html IS NULL"
+    ).fetchall()
+    db.executemany(
+        "UPDATE posts SET preview = ?, body_html = ? WHERE id = ?",
+        [
+            (get_post_preview(body), render_markdown(body), post_id)
+            for post_id, body in stale
+        ],
+    )
+
+    # Rows written before SQLite stamped them hold local-time isoformat() values;
+    # convert those once to the same UTC millisecond format
+    if db.execute("PRAGMA user_version").fetchone()[0] < 1:
+        for column in ("created_at", "updated_at"):
+            db.execute(
+                f"UPDATE posts SET {column} = strftime('%Y-%m-%d %H:%M:%f', "
+                f"{column}, 'utc') WHERE {column} LIKE '%T%'"
+            )
+        db.execute("PRAGMA user_version = 1")
+
+    db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_posts_created_at ON posts (created_at)"
+    )
+
+    # Every write to posts bumps a single-row counter, which keys the homepage
+    # cache in all worker processes without scanning the table
+    db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS posts_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    """
+    )
+    db.execute("INSERT OR IGNORE INTO posts_version (id, version) VALUES (1, 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        db.execute(
+            f"CREATE TRIGGER IF NOT EXISTS posts_version_{event.lower()} "
+            f"AFTER {event} ON posts "
+            "BEGIN UPDATE posts_version SET version = version + 1; END"
+        )
     db.commit()
 
-    # Seed sample posts if the table is empty
-    row = db.execute("SELECT COUNT(*) as cnt FROM posts").fetchone()
-    if row["cnt"] == 0:
+    # Seed sample posts if the table is empty, in one write transaction
+    db.execute("BEGIN IMMEDIATE")
+    (count,) = db.execute("SELECT COUNT(*) FROM posts").fetchone()
+    if count == 0:
         seed_posts = [
             {
                 "title": "Welcome to the HTMX Blog",
@@ -104,61 +241,111 @@ def init_db():
                 ),
             },
         ]
-        now = datetime.now().isoformat()
-        for post in seed_posts:
-            db.execute(
-                "INSERT INTO posts (title, body, created_at, updated_at) VALUES (?, ?, ?, ?)",
-                (post["title"], post["body"], now, now),
-            )
-        db.commit()
+        db.executemany(
+            "INSERT INTO posts "
+            "(title, body, preview, body_html, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, strftime('%Y-%m-%d %H:%M:%f', 'now'), "
+            "strftime('%Y-%m-%d %H:%M:%f', 'now'))",
+            [
+                (
+                    post["title"],
+                    post["body"],
+                    get_post_preview(post["body"]),
+                    render_markdown(post["body"]),
+                )
+                for post in seed_posts
+            ],
+        )
+    db.commit()
 
     db.close()
 
 
 def render_markdown(text):
-    """Convert markdown text to HTML."""
-    return markdown.markdown(text, extensions=["fenced_code", "tables"])
+    """Convert markdown text to HTML, reusing cached output for unchanged bodies."""
+    key = hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+    with _md_cache_lock:
+        html = _md_cache.get(key)
+        if html is not None:
+            _md_cache.move_to_end(key)
+            return html
+
+    if MARKDOWN_BACKEND == "python-markdown":
+        with _python_markdown_lock:
+            html = _python_markdown.reset().convert(text)
+    else:
+        html = _markdown_it.render(text)
+    with _md_cache_lock:
+        _md_cache[key] = html
+        if len(_md_cache) > MARKDOWN_CACHE_SIZE:
+            _md_cache.popitem(last=False)
+    return html
+
+
+render_markdown.cache_clear = _md_cache.clear
 
 
 def flash_message(message, category="success"):
     """Generate an OOB swap HTML snippet for flash messages."""
-    return (
-        f'<div id="flash-messages" hx-swap-oob="innerHTML">'
-        f'<div class="flash flash-{category}">{message}</div>'
-        f"</div>"
-    )
+    return _FLASH_PRE[category] + escape(message) + _FLASH_POST
+
+
+def flash_message_bytes(message, category="success"):
+    """Generate the flash message snippet as UTF-8 bytes for prebuilt responses."""
+    return _FLASH_PRE_BYTES[category] + escape(message).encode() + _FLASH_POST_BYTES
 
 
 def get_post_preview(body, max_length=200):
     """Return a plain text preview of a markdown post body."""
     # Strip markdown formatting for a clean preview
-    plain = body.replace("#", "").replace("*", "").replace("`", "").replace(">", "")
+    plain = body.translate(_PREVIEW_TABLE)
     plain = " ".join(plain.split())
     if len(plain) > max_length:
         return plain[:max_length] + "..."
     return plain
 
 
+def get_post_page(db, page=1):
+    """Return a cursor over one page of post summaries, newest first."""
+    # Templates iterate the cursor directly, so rows are never collected in a list
+    return db.execute(
+        "SELECT id, title, preview, created_at, updated_at FROM posts "
+        "ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+        (PAGE_SIZE, (page - 1) * PAGE_SIZE),
+    )
+
+
+def render_index(db):
+    """Render the homepage as UTF-8 bytes, cached while the posts are unchanged."""
+    (key,) = db.execute("SELECT version FROM posts_version").fetchone()
+    body = _index_cache.get(key)
+    if body is None:
+        body = render_template(
+            "index.html", posts=get_post_page(db), page=1, page_size=PAGE_SIZE
+        ).encode()
+        _index_cache.clear()
+        _index_cache[key] = body
+    return body
+
+
 @app.route("/")
 def index():
-    """Display the homepage with all blog posts."""
-    db = get_db()
-    posts = db.execute(
-        "SELECT * FROM posts ORDER BY created_at DESC"
-    ).fetchall()
-    posts_with_preview = []
-    for post in posts:
-        posts_with_preview.append(
-            {
-                "id": post["id"],
-                "title": post["title"],
-                "body": post["body"],
-                "preview": get_post_preview(post["body"]),
-                "created_at": post["created_at"],
-                "updated_at": post["updated_at"],
-            }
-        )
-    return render_template("index.html", posts=posts_with_preview)
+    """Display the homepage with the first page of blog posts."""
+    return render_index(get_db())
+
+
+@app.route("/posts")
+def list_posts():
+    """Return a page of post cards for infinite scrolling."""
+    page = max(request.args.get("page", 1, type=int), 1)
+    # Pages beyond MAX_PAGE could never hold posts, so they render empty
+    posts = get_post_page(get_db(), page) if page <= MAX_PAGE else []
+    return render_template(
+        "posts_fragment.html",
+        posts=posts,
+        page=page,
+        page_size=PAGE_SIZE,
+    )
 
 
 @app.route("/posts/new")
@@ -181,49 +368,36 @@ def create_post():
         return response
 
     db = get_db()
-    now = datetime.now().isoformat()
-    db.execute(
-        "INSERT INTO posts (title, body, created_at, updated_at) VALUES (?, ?, ?, ?)",
-        (title, body, now, now),
-    )
-    db.commit()
-
-    # Re-fetch all posts and return the full list with a flash message
-    posts = db.execute(
-        "SELECT * FROM posts ORDER BY created_at DESC"
-    ).fetchall()
-    posts_with_preview = []
-    for post in posts:
-        posts_with_preview.append(
-            {
-                "id": post["id"],
-                "title": post["title"],
-                "body": post["body"],
-                "preview": get_post_preview(post["body"]),
-                "created_at": post["created_at"],
-                "updated_at": post["updated_at"],
-            }
+    with db:
+        db.execute(
+            "INSERT INTO posts "
+            "(title, body, preview, body_html, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, strftime('%Y-%m-%d %H:%M:%f', 'now'), "
+            "strftime('%Y-%m-%d %H:%M:%f', 'now'))",
+            (title, body, get_post_preview(body), render_markdown(body)),
         )
 
-    html = render_template("index.html", posts=posts_with_preview)
-    html += flash_message("Post created successfully!")
-    response = make_response(html)
+    # Return the homepage, which also primes the cache for the next visitor
+    body = render_index(db) + flash_message_bytes("Post created successfully!")
+    response = make_response(body)
     response.headers["HX-Push-Url"] = "/"
     return response
 
 
 @app.route("/posts/<int:post_id>")
 def view_post(post_id):
-    """Display a single blog post with rendered markdown."""
+    """Display a single blog post with its pre-rendered markdown."""
     db = get_db()
-    post = db.execute("SELECT * FROM posts WHERE id = ?", (post_id,)).fetchone()
+    post = db.execute(
+        "SELECT id, title, body_html, created_at, updated_at FROM posts WHERE id = ?",
+        (post_id,),
+    ).fetchone()
     if post is None:
         response = make_response(flash_message("Post not found.", "error"))
         response.status_code = 404
         return response
 
-    rendered_body = render_markdown(post["body"])
-    return render_template("post.html", post=post, rendered_body=rendered_body)
+    return render_template("post.html", post=post, rendered_body=post["body_html"])
 
 
 @app.route("/posts/<int:post_id>/edit")
@@ -253,48 +427,32 @@ def update_post(post_id):
         return response
 
     db = get_db()
-    now = datetime.now().isoformat()
-    db.execute(
-        "UPDATE posts SET title = ?, body = ?, updated_at = ? WHERE id = ?",
-        (title, body, now, post_id),
-    )
-    db.commit()
+    rendered_body = render_markdown(body)
+    with db:
+        db.execute(
+            "UPDATE posts SET title = ?, body = ?, preview = ?, body_html = ?, "
+            "updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE id = ?",
+            (title, body, get_post_preview(body), rendered_body, post_id),
+        )
 
-    post = db.execute("SELECT * FROM posts WHERE id = ?", (post_id,)).fetchone()
-    rendered_body = render_markdown(post["body"])
+    post = db.execute(
+        "SELECT id, title, created_at, updated_at FROM posts WHERE id = ?", (post_id,)
+    ).fetchone()
 
-    html = render_template("post.html", post=post, rendered_body=rendered_body)
-    html += flash_message("Post updated successfully!")
-    return html
+    body = render_template("post.html", post=post, rendered_body=rendered_body)
+    return body.encode() + flash_message_bytes("Post updated successfully!")
 
 
 @app.route("/posts/<int:post_id>", methods=["DELETE"])
 def delete_post(post_id):
     """Delete a blog post and return the updated post list."""
     db = get_db()
-    db.execute("DELETE FROM posts WHERE id = ?", (post_id,))
-    db.commit()
-
-    # Return updated post list
-    posts = db.execute(
-        "SELECT * FROM posts ORDER BY created_at DESC"
-    ).fetchall()
-    posts_with_preview = []
-    for post in posts:
-        posts_with_preview.append(
-            {
-                "id": post["id"],
-                "title": post["title"],
-                "body": post["body"],
-                "preview": get_post_preview(post["body"]),
-                "created_at": post["created_at"],
-                "updated_at": post["updated_at"],
-            }
-        )
+    with db:
+        db.execute("DELETE FROM posts WHERE id = ?", (post_id,))
 
-    html = render_template("index.html", posts=posts_with_preview)
-    html += flash_message("Post deleted.")
-    response = make_response(html)
+    # Return the homepage, which also primes the cache for the next visitor
+    body = render_index(db) + flash_message_bytes("Post deleted.")
+    response = make_response(body)
     response.headers["HX-Push-Url"] = "/"
     return response
 
@@ -0,0 +1,141 @@
+# ABOUTME: Tests for the HTMX blog's database migration, pagination, and caching.
+# ABOUTME: Each test runs against a fresh SQLite file using Flask's test client.
+
+import os
+import queue
+import re
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as blog  # noqa: E402
+
+STAMP = re.compile(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3}$")
+
+
+def drain_pool():
+    """Close every pooled connection so the next request opens the test database."""
+    while True:
+        try:
+            blog._db_pool.get_nowait().close()
+        except queue.Empty:
+            return
+
+
+class BlogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.original_database = blog.DATABASE
+        blog.DATABASE = os.path.join(self.tmp.name, "blog.db")
+        drain_pool()
+        blog._index_cache.clear()
+        blog.render_markdown.cache_clear()
+        self.client = blog.app.test_client()
+
+    def tearDown(self):
+        drain_pool()
+        blog.DATABASE = self.original_database
+
+    def raw_db(self):
+        db = sqlite3.connect(blog.DATABASE)
+        self.addCleanup(db.close)
+        return db
+
+
+class MigrationTest(BlogTestCase):
+    def test_baseline_schema_is_backfilled_and_normalized(self):
+        db = self.raw_db()
+        db.execute(
+            """
+            CREATE TABLE posts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                body TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """
+        )
+        db.execute(
+            "INSERT INTO posts (title, body, created_at, updated_at) "
+            "VALUES ('Old', '# Heading', "
+            "'2024-01-02T03:04:05.123456', '2024-01-02T03:04:05.123456')"
+        )
+        db.commit()
+
+        blog.init_db()
+        blog.init_db()
+
+        row = db.execute(
+            "SELECT preview, body_html, created_at, updated_at FROM posts"
+        ).fetchone()
+        preview, body_html, created_at, updated_at = row
+        self.assertEqual(preview, "Heading")
+        self.assertIn("<h1>Heading</h1>", body_html)
+        self.assertRegex(created_at, STAMP)
+        self.assertRegex(updated_at, STAMP)
+        self.assertEqual(db.execute("PRAGMA user_version").fetchone()[0], 1)
+        # The existing post keeps the table from being seeded
+        self.assertEqual(db.execute("SELECT COUNT(*) FROM posts").fetchone()[0], 1)
+
+
+class PaginationTest(BlogTestCase):
+    def setUp(self):
+        super().setUp()
+        blog.init_db()
+        db = self.raw_db()
+        (seeded,) = db.execute("SELECT COUNT(*) FROM posts").fetchone()
+        db.executemany(
+            "INSERT INTO posts (title, body, preview, body_html) VALUES (?, ?, '', '')",
+            [(f"Post {n}", "body") for n in range(2 * blog.PAGE_SIZE - seeded)],
+        )
+        db.commit()
+
+    def test_full_pages_end_with_a_sentinel(self):
+        html = self.client.get("/").get_data(as_text=True)
+        self.assertEqual(html.count('class="post-card"'), blog.PAGE_SIZE)
+        self.assertIn('hx-get="/posts?page=2"', html)
+
+        html = self.client.get("/posts?page=2").get_data(as_text=True)
+        self.assertEqual(html.count('class="post-card"'), blog.PAGE_SIZE)
+        self.assertIn('hx-get="/posts?page=3"', html)
+
+    def test_past_the_last_page_is_empty(self):
+        for page in (3, blog.MAX_PAGE + 1, 10**30):
+            response = self.client.get(f"/posts?page={page}")
+            self.assertEqual(response.status_code, 200)
+            html = response.get_data(as_text=True)
+            self.assertNotIn("post-card", html)
+            self.assertNotIn("load-more", html)
+            self.assertNotIn("empty-state", html)
+
+
+class IndexCacheTest(BlogTestCase):
+    def test_write_from_another_connection_invalidates_index(self):
+        blog.init_db()
+        self.assertIn(b"Why HTMX?", self.client.get("/").data)
+
+        db = self.raw_db()
+        db.execute("UPDATE posts SET title = 'Renamed' WHERE title = 'Why HTMX?'")
+        db.commit()
+
+        body = self.client.get("/").data
+        self.assertIn(b"Renamed", body)
+        self.assertNotIn(b"Why HTMX?", body)
+
+
+class FlashMessageTest(unittest.TestCase):
+    def test_message_is_escaped(self):
+        message = '<script>alert("x")</script>'
+        self.assertNotIn("<script>", blog.flash_message(message))
+        self.assertIn("&lt;script&gt;", blog.flash_message(message))
+        self.assertNotIn(b"<script>", blog.flash_message_bytes(message, "error"))
+        self.assertIn(b"&lt;script&gt;", blog.flash_message_bytes(message, "error"))
+
+
+if __name__ == "__main__":
+    unittest.main()